@@ -1,6 +1,9 @@
 import os
+import asyncio
 import logging
-from datetime import datetime, date, time
+from datetime import date, time, timedelta
+from functools import lru_cache
+from typing import List, Tuple
 
 from dotenv import load_dotenv
 from telegram import Update
@@ -14,31 +17,40 @@ logger = logging.getLogger("birthday-bot")
 
 DAYS_BEFORE = 3
 CHECK_TIME = time(9, 0)  # ежедневная проверка (время машины)
+SEND_CONCURRENCY = 25  # одновременных send_message в daily_check
+
+_SEPS = (".", "-", "/")
+
+HELP_TEXT = (
+    "🎂 Я помогу хранить дни рождения и напоминать о них.\n\n"
+    "Команды:\n"
+    "• /add Имя Дата — добавить/обновить (пример: /add Маша 14.02 или /add Маша 14.02.2004)\n"
+    "• /delete Имя — удалить запись (пример: /delete Маша)\n"
+    "• /list — показать все сохранённые\n"
+    "• /help — помощь\n\n"
+    "Форматы даты: DD.MM, DD.MM.YYYY, YYYY-MM-DD (также с '-' или '/')"
+)
 
 
 def help_text() -> str:
-    return (
-        "🎂 Я помогу хранить дни рождения и напоминать о них.\n\n"
-        "Команды:\n"
-        "• /add Имя Дата — добавить/обновить (пример: /add Маша 14.02 или /add Маша 14.02.2004)\n"
-        "• /delete Имя — удалить запись (пример: /delete Маша)\n"
-        "• /list — показать все сохранённые\n"
-        "• /help — помощь\n\n"
-        "Форматы даты: DD.MM, DD.MM.YYYY, YYYY-MM-DD (также с '-' или '/')"
-    )
+    return HELP_TEXT
 
 
 def parse_date(raw: str):
     s = raw.strip()
 
-    # ISO: YYYY-MM-DD
-    try:
-        dt = datetime.strptime(s, "%Y-%m-%d").date()
-        return dt.day, dt.month, dt.year
-    except ValueError:
-        pass
+    # ISO: YYYY-MM-DD (или через '/') — узнаём по форме, без strptime и перехвата исключения
+    if len(s) > 4 and s[4] in "-/" and s[:4].isdigit():
+        parts = s.split(s[4])
+        if len(parts) == 3:
+            yyyy, mm, dd = parts
+            day = int(dd)
+            month = int(mm)
+            year = int(yyyy)
+            _ = date(year, month, day)
+            return day, month, year
 
-    for sep in (".", "-", "/"):
+    for sep in _SEPS:
         parts = s.split(sep)
         if len(parts) == 2:
             dd, mm = parts
@@ -57,23 +69,29 @@ def parse_date(raw: str):
     raise ValueError("bad date format")
 
 
+@lru_cache(maxsize=1024)  # today входит в ключ, так что кэш не устаревает при смене дня
 def next_occurrence(day: int, month: int, today: date) -> date:
     d = date(today.year, month, day)
     return d if d >= today else date(today.year + 1, month, day)
 
 
+@lru_cache(maxsize=2048)
+def _fmt_dm(day: int, month: int) -> str:
+    return f"{day:02d}.{month:02d}"
+
+
 def format_bday(name: str, day: int, month: int, year):
     if year is None:
-        return f"• {name}: {day:02d}.{month:02d}"
-    return f"• {name}: {day:02d}.{month:02d}.{year}"
+        return f"• {name}: {_fmt_dm(day, month)}"
+    return f"• {name}: {_fmt_dm(day, month)}.{year}"
 
 
 async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(help_text())
+    await update.message.reply_text(HELP_TEXT)
 
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(help_text())
+    await update.message.reply_text(HELP_TEXT)
 
 
 async def add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -97,9 +115,9 @@ async def add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     user_id = update.effective_user.id
-    db.upsert_birthday(user_id, name, day, month, year)
+    await asyncio.to_thread(db.upsert_birthday, user_id, name, day, month, year)
 
-    shown = f"{day:02d}.{month:02d}" + (f".{year}" if year else "")
+    shown = _fmt_dm(day, month) + (f".{year}" if year else "")
     await update.message.reply_text(f"✅ Сохранил: {name} — {shown}")
 
 
@@ -114,7 +132,7 @@ async def delete_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         return
 
     user_id = update.effective_user.id
-    deleted = db.delete_birthday(user_id, name)
+    deleted = await asyncio.to_thread(db.delete_birthday, user_id, name)
 
     if deleted:
         await update.message.reply_text(f"🗑️ Удалил: {name}")
@@ -124,7 +142,7 @@ async def delete_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
 async def list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    items = db.list_birthdays(user_id)
+    items = await asyncio.to_thread(db.list_birthdays, user_id)
 
     if not items:
         await update.message.reply_text("Пока пусто. Добавь: /add Имя Дата")
@@ -135,55 +153,68 @@ async def list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     for it in items:
         lines.append(format_bday(it["name"], it["day"], it["month"], it["year"]))
 
-    # ближайшее
-    nearest = min(
-        ((next_occurrence(it["day"], it["month"], today) - today).days, it["name"], it)
-        for it in items
-    )
-    diff, nm, it = nearest
-    occ = next_occurrence(it["day"], it["month"], today)
+    # ближайшее: один проход; при равенстве остаётся первое по порядку из SQL (month, day, имя)
+    diff, nm, occ = None, None, None
+    for it in items:
+        cand = next_occurrence(it["day"], it["month"], today)
+        d = (cand - today).days
+        if diff is None or d < diff:
+            diff, nm, occ = d, it["name"], cand
 
+    dm = _fmt_dm(occ.day, occ.month)
     if diff == 0:
-        tail = f"\n\n🔥 Ближайшее: сегодня у {nm} ({occ.strftime('%d.%m')})"
+        tail = f"\n\n🔥 Ближайшее: сегодня у {nm} ({dm})"
     elif diff == 1:
-        tail = f"\n\n✨ Ближайшее: завтра у {nm} ({occ.strftime('%d.%m')})"
+        tail = f"\n\n✨ Ближайшее: завтра у {nm} ({dm})"
     else:
-        tail = f"\n\n✨ Ближайшее: через {diff} дн. у {nm} ({occ.strftime('%d.%m')})"
+        tail = f"\n\n✨ Ближайшее: через {diff} дн. у {nm} ({dm})"
 
     await update.message.reply_text("\n".join(lines) + tail)
 
 
 def reminder_text(name: str, when: date, days_left: int) -> str:
+    dm = _fmt_dm(when.day, when.month)
     if days_left == 0:
-        return f"🎉 Сегодня день рождения у *{name}* — {when.strftime('%d.%m')}!"
+        return f"🎉 Сегодня день рождения у *{name}* — {dm}!"
     if days_left == 1:
-        return f"⏰ Завтра день рождения у *{name}* — {when.strftime('%d.%m')}."
-    return f"⏰ Через *{days_left}* дн. день рождения у *{name}* — {when.strftime('%d.%m')}."
+        return f"⏰ Завтра день рождения у *{name}* — {dm}."
+    return f"⏰ Через *{days_left}* дн. день рождения у *{name}* — {dm}."
+
+
+async def _send_reminder(bot, sem: asyncio.Semaphore, b, today: date) -> Tuple[int, int]:
+    occ = today + timedelta(days=b["days_left"])
+    async with sem:
+        await bot.send_message(
+            chat_id=b["user_id"],
+            text=reminder_text(b["name"], occ, b["days_left"]),
+            parse_mode=ParseMode.MARKDOWN,
+        )
+    return b["occ_year"], b["id"]
 
 
 async def daily_check(context: ContextTypes.DEFAULT_TYPE) -> None:
     today = date.today()
-    for user_id in db.get_all_users():
-        for b in db.get_birthdays_for_user(user_id):
-            occ = next_occurrence(b["day"], b["month"], today)
-            days_left = (occ - today).days
+    if not await asyncio.to_thread(db.has_due_birthdays, today, DAYS_BEFORE):
+        return
 
-            if not (0 <= days_left <= DAYS_BEFORE):
-                continue
+    # окно DAYS_BEFORE и «1 раз в год на запись» считаются в SQL одним запросом
+    due = await asyncio.to_thread(db.get_due_birthdays, today, DAYS_BEFORE)
+
+    # рассылка параллельно, но не больше SEND_CONCURRENCY запросов к Telegram одновременно
+    sem = asyncio.Semaphore(SEND_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_send_reminder(context.bot, sem, b, today) for b in due),
+        return_exceptions=True,
+    )
 
-            # чтобы не слать повторно каждый день — 1 раз в год на запись
-            if b["last_notified_year"] == occ.year:
-                continue
+    notified: List[Tuple[int, int]] = []
+    for b, res in zip(due, results):
+        if isinstance(res, BaseException):
+            logger.warning("Cannot send to %s: %s", b["user_id"], res)
+        else:
+            notified.append(res)
 
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=reminder_text(b["name"], occ, days_left),
-                    parse_mode=ParseMode.MARKDOWN,
-                )
-                db.set_last_notified_year(b["id"], occ.year)
-            except Exception as e:
-                logger.warning("Cannot send to %s: %s", user_id, e)
+    await asyncio.to_thread(db.set_last_notified_years, notified)
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -203,7 +234,8 @@ def main() -> None:
 
     db.init_db()
 
-    app = Application.builder().token(token).build()
+    # обработчики ждут БД в asyncio.to_thread, поэтому апдейты разных пользователей могут идти параллельно
+    app = Application.builder().token(token).concurrent_updates(True).build()
 
     app.add_handler(CommandHandler("start", start_cmd))
     app.add_handler(CommandHandler("help", help_cmd))
@@ -1,17 +1,94 @@
 import sqlite3
+import threading
 from contextlib import contextmanager
-from typing import Optional, List, Dict
+from datetime import date, timedelta
+from typing import Optional, List, Tuple
 
 DB_PATH = "birthdays.sqlite3"
 
+# одно соединение на весь процесс: без open/close на каждую команду
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+# SQL собраны в константы: строки не пересобираются, а sqlite3 берёт готовые statements из кэша соединения
+SQL_UPSERT = """
+    INSERT INTO birthdays(user_id, name, day, month, year, doy, last_notified_year)
+    VALUES (?, ?, ?, ?, ?, ?, NULL)
+    ON CONFLICT(user_id, name COLLATE NOCASE) DO UPDATE SET
+        day=excluded.day,
+        month=excluded.month,
+        year=excluded.year,
+        doy=excluded.doy,
+        last_notified_year=NULL;
+"""
+
+# и upsert, и delete идут по уникальному индексу UNIQUE(user_id, name COLLATE NOCASE) — отдельный индекс не нужен
+SQL_DELETE = "DELETE FROM birthdays WHERE user_id=? AND name=? COLLATE NOCASE;"
+
+SQL_LIST = "SELECT name, day, month, year FROM birthdays WHERE user_id=? ORDER BY month, day, LOWER(name);"
+
+# окно отбирается по индексу idx_birthdays_doy (два диапазона — на случай перехода через Новый год),
+# дата в SQL считается только для уже попавших в окно строк
+_SQL_DUE_WINDOW = """
+    SELECT id, user_id, name, day, month, last_notified_year,
+           CASE WHEN doy >= :today_doy THEN :year ELSE :year + 1 END AS occ_year
+    FROM birthdays
+    WHERE doy BETWEEN :lo1 AND :hi1 OR doy BETWEEN :lo2 AND :hi2
+"""
+
+SQL_DUE = f"""
+    SELECT id, user_id, name, occ_year,
+           CAST(julianday(printf('%04d-%02d-%02d', occ_year, month, day)) - julianday(:today) AS INTEGER)
+               AS days_left
+    FROM ({_SQL_DUE_WINDOW})
+    WHERE last_notified_year IS NOT occ_year;
+"""
+
+SQL_EXISTS_DUE = f"""
+    SELECT 1
+    FROM ({_SQL_DUE_WINDOW})
+    WHERE last_notified_year IS NOT occ_year
+    LIMIT 1;
+"""
+
+SQL_SET_NOTIFIED = "UPDATE birthdays SET last_notified_year=? WHERE id=?;"
+
+# WAL: чтение не ждёт запись, synchronous=NORMAL — без fsync на каждый коммит
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA cache_size = -8000;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA mmap_size = 67108864;",
+)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = _connect()
+        with _conn:  # commit при успехе, rollback при исключении
+            yield _conn
+
+
+# отдельное read-only соединение для ежедневного сканирования: не занимает _lock и не ждёт писателя (WAL)
+@contextmanager
+def read_conn():
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
     try:
-        conn.execute("PRAGMA foreign_keys = ON;")
         yield conn
-        conn.commit()
     finally:
         conn.close()
 
@@ -27,92 +104,73 @@ def init_db() -> None:
                 day INTEGER NOT NULL,
                 month INTEGER NOT NULL,
                 year INTEGER,
+                doy INTEGER,
                 last_notified_year INTEGER,
                 UNIQUE(user_id, name COLLATE NOCASE)
             );
             """
         )
+        # миграция старых баз: колонка doy = month*100 + day для выборки окна по индексу
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(birthdays);")}
+        if "doy" not in columns:
+            conn.execute("ALTER TABLE birthdays ADD COLUMN doy INTEGER;")
+            conn.execute("UPDATE birthdays SET doy = month * 100 + day;")
+        conn.execute("DROP INDEX IF EXISTS idx_birthdays_month_day;")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_birthdays_user ON birthdays(user_id);")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_birthdays_doy ON birthdays(doy);")
 
 
 def upsert_birthday(user_id: int, name: str, day: int, month: int, year: Optional[int]) -> None:
     with get_conn() as conn:
-        conn.execute(
-            """
-            INSERT INTO birthdays(user_id, name, day, month, year, last_notified_year)
-            VALUES (?, ?, ?, ?, ?, NULL)
-            ON CONFLICT(user_id, name) DO UPDATE SET
-                day=excluded.day,
-                month=excluded.month,
-                year=excluded.year,
-                last_notified_year=NULL;
-            """,
-            (user_id, name, day, month, year),
-        )
+        conn.execute(SQL_UPSERT, (user_id, name, day, month, year, month * 100 + day))
 
 
 def delete_birthday(user_id: int, name: str) -> int:
     with get_conn() as conn:
-        cur = conn.execute(
-            "DELETE FROM birthdays WHERE user_id=? AND name=? COLLATE NOCASE;",
-            (user_id, name),
-        )
+        cur = conn.execute(SQL_DELETE, (user_id, name))
         return cur.rowcount
 
 
-def list_birthdays(user_id: int) -> List[Dict]:
+# строки отдаются как sqlite3.Row (доступ по имени колонки), без перекладывания в dict
+def list_birthdays(user_id: int) -> List[sqlite3.Row]:
     with get_conn() as conn:
-        cur = conn.execute(
-            """
-            SELECT name, day, month, year
-            FROM birthdays
-            WHERE user_id=?
-            ORDER BY month, day, LOWER(name);
-            """,
-            (user_id,),
-        )
-        rows = cur.fetchall()
-
-    return [
-        {"name": r[0], "day": int(r[1]), "month": int(r[2]), "year": (int(r[3]) if r[3] is not None else None)}
-        for r in rows
-    ]
-
-
-def get_all_users() -> List[int]:
+        return conn.execute(SQL_LIST, (user_id,)).fetchall()
+
+
+def _due_params(today: date, days_before: int) -> dict:
+    last = today + timedelta(days=days_before)
+    today_doy = today.month * 100 + today.day
+    last_doy = last.month * 100 + last.day
+    if last.year == today.year:
+        lo1, hi1, lo2, hi2 = today_doy, last_doy, 1, 0  # второй диапазон пустой
+    else:
+        lo1, hi1, lo2, hi2 = today_doy, 1231, 101, last_doy
+    return {
+        "today": today.isoformat(),
+        "today_doy": today_doy,
+        "year": today.year,
+        "lo1": lo1,
+        "hi1": hi1,
+        "lo2": lo2,
+        "hi2": hi2,
+    }
+
+
+# записи, о которых пора напомнить: ДР в ближайшие days_before дней и напоминания за этот год ещё не было
+def get_due_birthdays(today: date, days_before: int) -> List[sqlite3.Row]:
+    with read_conn() as conn:
+        return conn.execute(SQL_DUE, _due_params(today, days_before)).fetchall()
+
+
+# быстрая проверка «есть ли сегодня кого поздравлять» на общем соединении
+def has_due_birthdays(today: date, days_before: int) -> bool:
     with get_conn() as conn:
-        cur = conn.execute("SELECT DISTINCT user_id FROM birthdays;")
-        return [int(r[0]) for r in cur.fetchall()]
+        return conn.execute(SQL_EXISTS_DUE, _due_params(today, days_before)).fetchone() is not None
 
 
-def get_birthdays_for_user(user_id: int) -> List[Dict]:
+def set_last_notified_years(updates: List[Tuple[int, int]]) -> None:
+    # updates: [(year, birthday_id), ...] — одна транзакция на весь пакет
+    if not updates:
+        return
     with get_conn() as conn:
-        cur = conn.execute(
-            """
-            SELECT id, name, day, month, year, last_notified_year
-            FROM birthdays
-            WHERE user_id=?;
-            """,
-            (user_id,),
-        )
-        rows = cur.fetchall()
-
-    return [
-        {
-            "id": int(r[0]),
-            "name": r[1],
-            "day": int(r[2]),
-            "month": int(r[3]),
-            "year": (int(r[4]) if r[4] is not None else None),
-            "last_notified_year": (int(r[5]) if r[5] is not None else None),
-        }
-        for r in rows
-    ]
-
-
-def set_last_notified_year(birthday_id: int, year: int) -> None:
-    with get_conn() as conn:
-        conn.execute(
-            "UPDATE birthdays SET last_notified_year=? WHERE id=?;",
-            (year, birthday_id),
-        )
+        conn.executemany(SQL_SET_NOTIFIED, updates)